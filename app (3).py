@@ -1,16 +1,42 @@
 import base64
 import requests
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 import time
 import traceback
 import hmac
-import hashlib
-import json
+import logging
+import orjson
 import os
+import sys
 import threading
+from collections import deque
+from dataclasses import dataclass
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import gradio as gr
+import numpy as np
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from requests.models import PreparedRequest
+from urllib3.util.retry import Retry
+import websocket
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        # Không có numba: giữ nguyên hàm (chạy bằng NumPy thuần)
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda func: func
+
+# Log chi tiết trong vòng quét dùng logger (mặc định INFO, bật BOT_LOG=DEBUG để xem)
+logger = logging.getLogger("bot")
+_log_handler = logging.StreamHandler(sys.stdout)  # Cùng luồng với print để log không bị lệch thứ tự
+_log_handler.setFormatter(logging.Formatter("%(message)s"))
+logger.addHandler(_log_handler)
+logger.propagate = False
 
 # ==============================================================================
 # ========== CẤU HÌNH TRUNG TÂM ==========
@@ -19,8 +45,11 @@ from dotenv import load_dotenv
 # --- Cài đặt chung ---
 VIETNAM_TIMEZONE = ZoneInfo("Asia/Ho_Chi_Minh")
 CHART_TYPE = "5m"
+CHART_BAR_SECONDS = 5 * 60  # Độ dài một nến CHART_TYPE (giây)
 LEVERAGE = 30
 ORDER_TIMEOUT_MINUTES = 36
+ORDER_TIMEOUT_SECONDS = ORDER_TIMEOUT_MINUTES * 60
+SL_RECONCILE_EVERY_CYCLES = 6  # Khi WS private hoạt động, chỉ quét REST dời SL mỗi 6 chu kỳ (30 phút)
 
 ### CỜ BẬT/TẮT CHIẾN LƯỢC ###
 ALLOW_SHORT_TRADES = True
@@ -38,76 +67,200 @@ LONG_BODY_SIZE_THRESHOLD = 0.03/100    # Thân nến phải lớn hơn 0.03%
 LONG_SMALL_WICK_THRESHOLD = 0.02/100   # Râu trên phải nhỏ hơn 0.02%
 LONG_SIGNAL_WICK_MIN_PERCENT = 0.25/100  # Râu dưới phải lớn hơn 0.25% (Theo yêu cầu)
 
+# --- Phân tích theo lô (NumPy/numba) khi số symbol đủ lớn ---
+VECTORIZE_MIN_SYMBOLS = 8
+SIGNAL_THRESHOLDS = np.array([
+    SHORT_WICK_THRESHOLD, SHORT_BODY_SIZE_THRESHOLD, SHORT_SMALL_WICK_THRESHOLD, SHORT_SIGNAL_WICK_MIN_PERCENT,
+    LONG_LOWER_WICK_THRESHOLD, LONG_BODY_SIZE_THRESHOLD, LONG_SMALL_WICK_THRESHOLD, LONG_SIGNAL_WICK_MIN_PERCENT,
+], dtype=np.float64)
 
-# --- Lấy cấu hình API OKX ---
-load_dotenv()
-OKX_API_KEY = os.environ.get("OKX_API_KEY")
-OKX_SECRET_KEY = os.environ.get("OKX_SECRET_KEY")
-OKX_PASSPHRASE = os.environ.get("OKX_PASSPHRASE")
-OKX_BASE_URL = "https://www.okx.com"
 
-# --- Cấu hình Slack ---
-SLACK_WEBHOOK_URL = os.environ.get("SLACK_WEBHOOK_URL")
-SLACK_CHANNEL = os.environ.get("SLACK_CHANNEL", "#trading-alerts")
+# --- Cấu hình API OKX & Slack (nạp trong main(), không chạy lúc import) ---
+OKX_BASE_URL = "https://www.okx.com"
+OKX_WS_BUSINESS_URL = "wss://ws.okx.com:8443/ws/v5/business"  # Kênh nến (candle*) nằm ở endpoint business
+OKX_WS_PRIVATE_URL = "wss://ws.okx.com:8443/ws/v5/private"  # Kênh positions/orders (cần đăng nhập)
+
+@dataclass(frozen=True)
+class Config:
+    okx_api_key: str
+    okx_secret_key: str
+    okx_passphrase: str
+    slack_webhook_url: str
+    slack_channel: str
+    log_level: str
+
+    def is_complete(self):
+        # Đủ thông tin xác thực OKX hay chưa
+        return all([self.okx_api_key, self.okx_secret_key, self.okx_passphrase])
+
+def _parse_log_level(value):
+    # Kiểm tra BOT_LOG, giá trị không hợp lệ thì dùng INFO
+    level = value.strip().upper()
+    if level not in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
+        print(f"⚠️ BOT_LOG không hợp lệ: '{value}'. Dùng mặc định INFO.")
+        return "INFO"
+    return level
+
+def _load_config():
+    # Đọc cấu hình từ file .env và biến môi trường
+    load_dotenv()
+    return Config(
+        okx_api_key=os.environ.get("OKX_API_KEY"),
+        okx_secret_key=os.environ.get("OKX_SECRET_KEY"),
+        okx_passphrase=os.environ.get("OKX_PASSPHRASE"),
+        slack_webhook_url=os.environ.get("SLACK_WEBHOOK_URL"),
+        slack_channel=os.environ.get("SLACK_CHANNEL", "#trading-alerts"),
+        log_level=_parse_log_level(os.environ.get("BOT_LOG", "INFO")),
+    )
+
+_CFG = None
 
 # --- Biến toàn cục ---
-pending_orders = []
+pending_orders = {}  # orderId -> thông tin lệnh đang chờ khớp
 ORDERS_LOCK = threading.Lock()
-
-# --- Kiểm tra cấu hình API ---
-if not all([OKX_API_KEY, OKX_SECRET_KEY, OKX_PASSPHRASE]):
-    print("❌ Lỗi: Vui lòng thiết lập đầy đủ OKX_API_KEY, OKX_SECRET_KEY, và OKX_PASSPHRASE trong file .env")
-    exit(1)
+_LEVERAGE_CACHE = {}  # (symbol, posSide) -> đòn bẩy đã thiết lập thành công
+_LEVERAGE_LOCK = threading.Lock()
+_SL_STATE = {}  # (instId, posSide) -> lệnh SL (algo) đang live (chỉ lưu kết quả tra cứu thành công)
+_SL_MOVING = set()  # Các vị thế đang được tra cứu/dời SL (tránh gửi trùng giữa REST và WebSocket)
+_SL_RETRY_AT = {}  # (instId, posSide) -> thời điểm được thử lại sau khi tra cứu/dời SL thất bại
+SL_RETRY_BACKOFF_SECONDS = 60
+_SL_MOVED_AT = {}  # (instId, posSide) -> thời điểm (monotonic) SL được dời về entry gần nhất
+_SL_STATE_LOCK = threading.Lock()
+
+# --- Phiên HTTP dùng chung (tái sử dụng kết nối TCP/TLS giữa các lần gọi) ---
+HTTP_TIMEOUT = (3, 7)  # (connect, read)
+
+def _build_session():
+    # Tạo Session với connection pool và retry cho lỗi tạm thời
+    session = requests.Session()
+    retry = Retry(total=2, backoff_factor=0.2, status_forcelist=[429, 500, 502, 503, 504])
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry))
+    return session
+
+_OKX_SESSION = _build_session()
+_SLACK_SESSION = _build_session()
+_PUBLIC_HEADERS = {'OK-ACCESS-KEY': None, 'OK-ACCESS-PASSPHRASE': None}  # Bỏ header xác thực cho endpoint công khai
+
+# --- Thread pool dùng chung để chạy song song các lệnh gọi REST (I/O-bound) ---
+EXECUTOR = ThreadPoolExecutor(max_workers=8)
+
+# --- HMAC đã nạp khóa sẵn (khóa bí mật không đổi trong suốt vòng đời bot) ---
+_HMAC_PROTO = None
 
 # --- CẤU HÌNH GIAO DỊCH CHO TỪNG SYMBOL ---
+@dataclass(frozen=True)
+class SymConfig:
+    symbol: str
+    position_size_usdt: float
+    rr_ratio: float
+    lot_size: float
+
 SYMBOLS = [
-    {
-        "symbol": "BTC-USDT-SWAP",
-        "position_size_usdt": 6,
-        "volume_multiplier": 1.0, # (Không còn được sử dụng)
-        "rr_ratio": 1,
-        "lot_size": 0.001
-    }
+    SymConfig(
+        symbol="BTC-USDT-SWAP",
+        position_size_usdt=6,
+        rr_ratio=1,
+        lot_size=0.001
+    )
 ]
 
 # ==============================================================================
 # ========== CÁC HÀM TIỆN ÍCH (SLACK & OKX API) ==========
 # ==============================================================================
 
-def send_slack_alert(message, is_critical=False):
-    # Gửi cảnh báo đến Slack
-    if not SLACK_WEBHOOK_URL: return
+def _apply_config(cfg):
+    # Gắn cấu hình vào module: chuẩn bị HMAC, header cố định của Session OKX và luồng gửi Slack
+    global _CFG, _HMAC_PROTO
+    logger.setLevel(cfg.log_level)
+    _HMAC_PROTO = hmac.new(cfg.okx_secret_key.encode(), None, 'sha256')
+    _OKX_SESSION.headers.update({
+        'OK-ACCESS-KEY': cfg.okx_api_key.encode(),
+        'OK-ACCESS-PASSPHRASE': cfg.okx_passphrase.encode(),
+        'Content-Type': 'application/json'
+    })
+    if _CFG is None:
+        threading.Thread(target=_slack_worker, daemon=True).start()
+    _CFG = cfg
+
+def _post_slack(payload):
+    # Gửi payload đến Slack webhook
     try:
-        prefix = "🚨 *CẢNH BÁO NGHIÊM TRỌNG* 🚨\n" if is_critical else "⚠️ *CẢNH BÁO* ⚠️\n"
-        payload = {"text": prefix + message, "channel": SLACK_CHANNEL, "username": "Trading Bot", "icon_emoji": ":robot_face:"}
-        requests.post(SLACK_WEBHOOK_URL, json=payload, timeout=10)
+        _SLACK_SESSION.post(_CFG.slack_webhook_url, json=payload, timeout=HTTP_TIMEOUT)
         print("✅ Đã gửi cảnh báo đến Slack")
     except Exception as e:
         print(f"⚠️ Lỗi gửi Slack: {e}")
 
+def _slack_worker():
+    # Luồng nền lấy cảnh báo từ hàng đợi và gửi lần lượt
+    while True:
+        payload = _SLACK_Q.get()
+        _post_slack(payload)
+        _SLACK_Q.task_done()
+
+_SLACK_Q = queue.Queue(maxsize=256)
+
+SLACK_CRITICAL_PUT_TIMEOUT = 5  # Giây chờ chỗ trống trong hàng đợi cho cảnh báo nghiêm trọng
+
+def send_slack_alert(message, is_critical=False):
+    # Gửi cảnh báo đến Slack qua hàng đợi (không chặn luồng gọi).
+    # Cảnh báo nghiêm trọng không bao giờ bị bỏ: chờ chỗ trống, hết hạn thì gửi trực tiếp.
+    if not _CFG or not _CFG.slack_webhook_url: return
+    prefix = "🚨 *CẢNH BÁO NGHIÊM TRỌNG* 🚨\n" if is_critical else "⚠️ *CẢNH BÁO* ⚠️\n"
+    payload = {"text": prefix + message, "channel": _CFG.slack_channel, "username": "Trading Bot", "icon_emoji": ":robot_face:"}
+    if is_critical:
+        try:
+            _SLACK_Q.put(payload, timeout=SLACK_CRITICAL_PUT_TIMEOUT)
+        except queue.Full:
+            print("⚠️ Hàng đợi Slack đã đầy, gửi trực tiếp cảnh báo nghiêm trọng.")
+            _post_slack(payload)
+        return
+    try:
+        _SLACK_Q.put_nowait(payload)
+    except queue.Full:
+        print("⚠️ Hàng đợi Slack đã đầy, bỏ qua cảnh báo.")
+
+_VN_OFFSET_SECONDS = None  # Độ lệch UTC của giờ Việt Nam, cập nhật mỗi chu kỳ quét
+
+def refresh_vn_offset():
+    # Tính lại độ lệch múi giờ Việt Nam (một lần mỗi chu kỳ)
+    global _VN_OFFSET_SECONDS
+    _VN_OFFSET_SECONDS = datetime.now(VIETNAM_TIMEZONE).utcoffset().total_seconds()
+
+def fmt_vn(fmt="%Y-%m-%d %H:%M:%S", ts=None):
+    # Định dạng thời điểm (mặc định: hiện tại) theo giờ Việt Nam bằng độ lệch đã lưu
+    if _VN_OFFSET_SECONDS is None:
+        refresh_vn_offset()
+    return time.strftime(fmt, time.gmtime((time.time() if ts is None else ts) + _VN_OFFSET_SECONDS))
+
+def okx_timestamp():
+    # Thời gian UTC dạng ISO 8601 có mili giây (vd: 2024-01-01T00:00:00.000Z)
+    t = time.time()
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(t)) + f".{int(t * 1000) % 1000:03d}Z"
+
 def okx_signature(timestamp, method, request_path, body=""):
     # Tạo chữ ký OKX
-    message = timestamp + method + request_path + body
-    mac = hmac.new(bytes(OKX_SECRET_KEY, 'utf-8'), bytes(message, 'utf-8'), hashlib.sha256)
+    # Sao chép HMAC đã nạp khóa sẵn thay vì khởi tạo lại từ đầu
+    mac = _HMAC_PROTO.copy()
+    mac.update((timestamp + method + request_path + body).encode())
     return base64.b64encode(mac.digest()).decode()
 
 def okx_request(method, endpoint, params=None, body=None):
     # Thực hiện yêu cầu API đến OKX
     try:
-        timestamp = datetime.utcnow().isoformat("T", "milliseconds") + "Z"
-        request_path = endpoint
+        timestamp = okx_timestamp()
+        url = OKX_BASE_URL + endpoint
         if method == "GET" and params:
-            request_path += "?" + "&".join([f"{k}={v}" for k, v in params.items()])
-        body_str = json.dumps(body) if body else ""
+            # Để requests mã hóa query string, chữ ký dùng đúng URL sẽ được gửi đi
+            prepared = PreparedRequest()
+            prepared.prepare_url(url, params)
+            url = prepared.url
+        request_path = url[len(OKX_BASE_URL):]
+        body_str = orjson.dumps(body).decode() if body else ""
         sign = okx_signature(timestamp, method, request_path, body_str)
-        headers = {
-            'OK-ACCESS-KEY': OKX_API_KEY, 'OK-ACCESS-SIGN': sign,
-            'OK-ACCESS-TIMESTAMP': timestamp, 'OK-ACCESS-PASSPHRASE': OKX_PASSPHRASE,
-            'Content-Type': 'application/json'
-        }
-        url = OKX_BASE_URL + request_path
-        response = requests.request(method, url, headers=headers, data=body_str, timeout=10)
-        return response.json()
+        # Header cố định (key, passphrase, content-type) đã gắn sẵn trên _OKX_SESSION
+        headers = {'OK-ACCESS-SIGN': sign, 'OK-ACCESS-TIMESTAMP': timestamp}
+        response = _OKX_SESSION.request(method, url, headers=headers, data=body_str, timeout=HTTP_TIMEOUT)
+        return orjson.loads(response.content)
     except Exception as e:
         print(f"❌ Lỗi OKX API Request: {e}")
         return None
@@ -118,11 +271,25 @@ def set_leverage(symbol, leverage, posSide):
     body = {"instId": symbol, "lever": str(leverage), "mgnMode": "isolated", "posSide": posSide}
     return okx_request("POST", endpoint, body=body)
 
-def place_order(symbol, side, posSide, price, sl_price, tp_price, size):
-    # Đặt lệnh limit có SL/TP
-    leverage_result = set_leverage(symbol, LEVERAGE, posSide)
+def ensure_leverage(symbol, leverage, posSide):
+    # Chỉ gọi set_leverage khi đòn bẩy của (symbol, posSide) chưa được thiết lập
+    key = (symbol, posSide)
+    with _LEVERAGE_LOCK:
+        if _LEVERAGE_CACHE.get(key) == leverage:
+            return True
+    leverage_result = set_leverage(symbol, leverage, posSide)
     if not leverage_result or leverage_result.get('code') != '0':
         print(f"❌ Lỗi thiết lập đòn bẩy cho {posSide}: {leverage_result}")
+        with _LEVERAGE_LOCK:
+            _LEVERAGE_CACHE.pop(key, None)
+        return False
+    with _LEVERAGE_LOCK:
+        _LEVERAGE_CACHE[key] = leverage
+    return True
+
+def place_order(symbol, side, posSide, price, sl_price, tp_price, size):
+    # Đặt lệnh limit có SL/TP
+    if not ensure_leverage(symbol, LEVERAGE, posSide):
         return None
         
     endpoint = "/api/v5/trade/order"
@@ -132,7 +299,12 @@ def place_order(symbol, side, posSide, price, sl_price, tp_price, size):
         "slTriggerPx": str(sl_price), "slOrdPx": "-1",
         "tpTriggerPx": str(tp_price), "tpOrdPx": "-1"
     }
-    return okx_request("POST", endpoint, body=body)
+    result = okx_request("POST", endpoint, body=body)
+    if not result or result.get('code') != '0':
+        # Lệnh lỗi có thể do đòn bẩy trên sàn đã bị đổi: lần sau thiết lập lại
+        with _LEVERAGE_LOCK:
+            _LEVERAGE_CACHE.pop((symbol, posSide), None)
+    return result
 
 def get_order_status(symbol, order_id):
     # Lấy trạng thái lệnh
@@ -177,22 +349,34 @@ def get_market_ticker(symbol):
         return float(result['data'][0]['last'])
     return None
 
-def get_pending_algo_orders(symbol, pos_side, order_type="sl"):
-    """Lấy các lệnh algo (SL/TP) đang chờ."""
+ALGO_ORDERS_PAGE_LIMIT = 100  # Số lệnh tối đa mỗi trang của orders-algo-pending
+
+def get_all_pending_algo_orders(order_type="sl"):
+    """
+    Lấy tất cả lệnh algo (SL/TP) đang chờ của tài khoản (phân trang theo algoId), nhóm theo (instId, posSide).
+    Trả về None nếu gọi API lỗi (khác với {} khi không có lệnh nào).
+    """
     endpoint = "/api/v5/trade/orders-algo-pending"
     params = {
         "instType": "SWAP",
-        "instId": symbol,
-        "ordType": order_type
+        "ordType": order_type,
+        "limit": str(ALGO_ORDERS_PAGE_LIMIT)
     }
-    result = okx_request("GET", endpoint, params=params)
-    if result and result.get('code') == '0' and result['data']:
-        matching_orders = [
-            order for order in result['data'] 
-            if order.get('posSide') == pos_side and order.get('state') == 'live'
-        ]
-        return matching_orders
-    return []
+    orders_by_position = {}
+    while True:
+        result = okx_request("GET", endpoint, params=params)
+        if not result or result.get('code') != '0':
+            print(f"❌ Lỗi lấy danh sách lệnh algo đang chờ: {result}")
+            return None
+        page = result['data'] or []
+        for order in page:
+            if order.get('state') == 'live':
+                key = (order.get('instId'), order.get('posSide'))
+                orders_by_position.setdefault(key, []).append(order)
+        # Trang chưa đầy là trang cuối, ngược lại lấy tiếp các lệnh cũ hơn algoId cuối cùng
+        if len(page) < ALGO_ORDERS_PAGE_LIMIT:
+            return orders_by_position
+        params = {**params, "after": page[-1]['algoId']}
 
 def modify_algo_order_sl(symbol, algo_id, new_sl_price):
     """Sửa đổi giá SL của một lệnh algo đang chạy."""
@@ -206,6 +390,93 @@ def modify_algo_order_sl(symbol, algo_id, new_sl_price):
     print(f"   -> Gửi yêu cầu dời SL cho AlgoID {algo_id} về {new_sl_price}")
     return okx_request("POST", endpoint, body=body)
 
+# ==============================================================================
+# ========== LUỒNG NẾN WEBSOCKET ==========
+# ==============================================================================
+
+_CANDLE_CACHE = {}  # symbol -> deque 2 nến đã đóng gần nhất (mảng thô như REST, cũ -> mới)
+_CANDLE_LOCK = threading.Lock()
+WS_RECV_TIMEOUT = 25  # OKX ngắt kết nối nếu 30 giây không có dữ liệu, gửi "ping" trước mốc này
+
+def _store_closed_candle(symbol, candle_data):
+    # Lưu nến đã đóng (confirm == "1") vào cache, bỏ qua bản đẩy trùng thời điểm
+    with _CANDLE_LOCK:
+        candles = _CANDLE_CACHE.setdefault(symbol, deque(maxlen=2))
+        if candles and candles[-1][0] == candle_data[0]:
+            candles[-1] = candle_data
+        else:
+            candles.append(candle_data)
+
+def _ws_loop(url, name, on_connect, on_message, on_disconnect=None):
+    # Vòng lặp WebSocket dùng chung: giữ kết nối bằng "ping", tự kết nối lại khi lỗi
+    while True:
+        ws = None
+        try:
+            ws = websocket.create_connection(url, timeout=WS_RECV_TIMEOUT)
+            on_connect(ws)
+            print(f"✅ Đã kết nối WebSocket {name}")
+            ping_pending = False  # Đã gửi "ping" nhưng chưa nhận được tin nào sau đó
+            while True:
+                try:
+                    raw = ws.recv()
+                except websocket.WebSocketTimeoutException:
+                    if ping_pending:
+                        # Kết nối nửa mở: gửi vẫn được nhưng không nhận được gì, buộc kết nối lại
+                        raise ConnectionError("không nhận được pong sau khi gửi ping")
+                    ws.send("ping")
+                    ping_pending = True
+                    continue
+                ping_pending = False
+                if raw == "pong":
+                    continue
+                # Lỗi xử lý một tin nhắn không được làm rớt kết nối
+                try:
+                    on_message(ws, orjson.loads(raw))
+                except Exception as e:
+                    print(f"⚠️ Lỗi xử lý tin nhắn WebSocket {name}: {e}")
+                    traceback.print_exc()
+        except Exception as e:
+            print(f"⚠️ Mất kết nối WebSocket {name}: {e}. Thử lại sau 5 giây...")
+            time.sleep(5)
+        finally:
+            if on_disconnect:
+                on_disconnect()
+            if ws:
+                ws.close()
+
+def _candle_stream_worker(symbols):
+    # Luồng nền: đăng ký kênh nến qua WebSocket
+    channel = f"candle{CHART_TYPE}"
+    subscribe_msg = orjson.dumps({"op": "subscribe", "args": [{"channel": channel, "instId": s} for s in symbols]}).decode()
+
+    def on_message(ws, msg):
+        if msg.get('event') == 'error':
+            print(f"❌ Lỗi đăng ký WebSocket nến: {msg}")
+            return
+        symbol = msg.get('arg', {}).get('instId')
+        for candle_data in msg.get('data') or []:
+            if candle_data[8] == "1":
+                _store_closed_candle(symbol, candle_data)
+
+    _ws_loop(OKX_WS_BUSINESS_URL, f"nến ({len(symbols)} symbol)", lambda ws: ws.send(subscribe_msg), on_message)
+
+def start_candle_stream(symbols):
+    # Khởi chạy luồng WebSocket nến trong nền
+    threading.Thread(target=_candle_stream_worker, args=(symbols,), daemon=True).start()
+
+def get_cached_candles(symbol):
+    """
+    Trả về [nến tín hiệu, nến trước] (mới -> cũ, cùng thứ tự với REST) từ cache WebSocket,
+    hoặc None nếu cache chưa có nến vừa đóng của chu kỳ hiện tại.
+    """
+    expected_ts = (int(time.time()) // CHART_BAR_SECONDS - 1) * CHART_BAR_SECONDS * 1000
+    with _CANDLE_LOCK:
+        candles = _CANDLE_CACHE.get(symbol)
+        if (not candles or len(candles) < 2 or int(candles[-1][0]) != expected_ts
+                or int(candles[-2][0]) != expected_ts - CHART_BAR_SECONDS * 1000):
+            return None
+        return [candles[-1], candles[-2]]
+
 # ==============================================================================
 # ========== LOGIC GIAO DỊCH CỐT LÕI ==========
 # ==============================================================================
@@ -213,19 +484,23 @@ def modify_algo_order_sl(symbol, algo_id, new_sl_price):
 def fetch_signal_candle(symbol):
     """
     Lấy 2 nến: data[0] (tín hiệu) và data[1] (nến trước) để so sánh volume.
+    Ưu tiên cache WebSocket, chỉ gọi REST khi cache chưa có nến mới nhất.
     """
     try:
-        url = f"{OKX_BASE_URL}/api/v5/market/history-candles"
-        # Lấy 2 nến: data[0] (tín hiệu) và data[1] (nến trước)
-        params = {"instId": symbol, "bar": CHART_TYPE, "limit": "2"} 
-        
-        response = requests.get(url, params=params, timeout=10)
-        data = response.json()
-        
-        # Kiểm tra cần 2 nến
-        if data.get('code') != '0' or not data.get('data') or len(data['data']) < 2:
-            print(f"❌ Không đủ dữ liệu nến cho {symbol} (cần 2 nến): {data}")
-            return None, None # Trả về 2 None
+        candles = get_cached_candles(symbol)
+        if candles is None:
+            url = f"{OKX_BASE_URL}/api/v5/market/history-candles"
+            # Lấy 2 nến: data[0] (tín hiệu) và data[1] (nến trước)
+            params = {"instId": symbol, "bar": CHART_TYPE, "limit": "2"} 
+            
+            response = _OKX_SESSION.get(url, params=params, headers=_PUBLIC_HEADERS, timeout=HTTP_TIMEOUT)
+            data = orjson.loads(response.content)
+            
+            # Kiểm tra cần 2 nến
+            if data.get('code') != '0' or not data.get('data') or len(data['data']) < 2:
+                print(f"❌ Không đủ dữ liệu nến cho {symbol} (cần 2 nến): {data}")
+                return None, None # Trả về 2 None
+            candles = data['data']
         
         def parse_candle(candle_data):
             """
@@ -239,87 +514,129 @@ def fetch_signal_candle(symbol):
                 "volume": float(candle_data[5]) # Volume là phần tử thứ 5 (index 5)
             }
         
-        signal_candle = parse_candle(data['data'][0])
-        prev_candle = parse_candle(data['data'][1])
+        signal_candle = parse_candle(candles[0])
+        prev_candle = parse_candle(candles[1])
 
         # LOG DEBUG (Đã cập nhật để hiển thị volume)
-        print("   --- LOG DEBUG API (RAW) ---")
-        print(f"   [data[0]] O:{data['data'][0][1]} H:{data['data'][0][2]} L:{data['data'][0][3]} C:{data['data'][0][4]} V:{data['data'][0][5]} (TÍN HIỆU)")
-        print(f"   [data[1]] O:{data['data'][1][1]} H:{data['data'][1][2]} L:{data['data'][1][3]} C:{data['data'][1][4]} V:{data['data'][1][5]} (NẾN TRƯỚC)")
-        print("   -----------------------------")
+        logger.debug("   --- LOG DEBUG API (RAW) ---\n"
+                     "   [data[0]] O:%s H:%s L:%s C:%s V:%s (TÍN HIỆU)\n"
+                     "   [data[1]] O:%s H:%s L:%s C:%s V:%s (NẾN TRƯỚC)\n"
+                     "   -----------------------------",
+                     *candles[0][1:6], *candles[1][1:6])
         
         return signal_candle, prev_candle # Trả về cả hai nến
     except Exception as e:
         print(f"❌ Lỗi lấy nến {symbol}: {e}")
         return None, None
 
-def analyze_short_signal(candle):
-    # Phân tích tín hiệu SHORT
+def analyze_signal(candle):
+    # Phân tích tín hiệu SHORT/LONG trong một lần tính, trả về "SHORT", "LONG" hoặc None
+    # Điều kiện % được so sánh dạng nhân (wick >= ngưỡng * giá) để tránh phép chia,
+    # điều kiện râu nhỏ (thường sai nhất) được kiểm tra trước.
     try:
         o, h, l, c = candle["open"], candle["high"], candle["low"], candle["close"]
-        if c >= o: return False 
-
-        body_size = o - c
-        upper_wick = h - o
-        lower_wick = c - l
+        if l <= 0: return None
+        body = c - o
+        is_bull = body > 0
+        body_size = abs(body)
+        if body_size == 0: return None
+
+        if not is_bull and ALLOW_SHORT_TRADES:
+            upper_wick = h - o
+            lower_wick = c - l
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("   [CHECK SHORT]\n"
+                             "   - %% Body (so với giá mở cửa):   %.4f%%\n"
+                             "   - %% Râu trên (so với giá cao nhất): %.4f%%\n"
+                             "   - %% Râu dưới (so với giá thấp nhất):  %.4f%%\n"
+                             "   - Tỉ lệ Râu trên/Thân:           %.2f",
+                             body_size / o * 100, upper_wick / h * 100,
+                             lower_wick / l * 100, upper_wick / body_size)
+
+            if (lower_wick <= SHORT_SMALL_WICK_THRESHOLD * l
+                    and upper_wick >= SHORT_SIGNAL_WICK_MIN_PERCENT * h
+                    and body_size >= SHORT_BODY_SIZE_THRESHOLD * o
+                    and upper_wick > SHORT_WICK_THRESHOLD * body_size):
+                return "SHORT"
+
+        elif is_bull and ALLOW_LONG_TRADES:
+            lower_wick = o - l
+            upper_wick = h - c
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("   [CHECK LONG]\n"
+                             "   - %% Body (so với giá mở cửa):    %.4f%%\n"
+                             "   - %% Râu trên (so với giá cao nhất):  %.4f%%\n"
+                             "   - %% Râu dưới (so với giá thấp nhất):   %.4f%%\n"
+                             "   - Tỉ lệ Râu dưới/Thân:            %.2f",
+                             body_size / o * 100, upper_wick / h * 100,
+                             lower_wick / l * 100, lower_wick / body_size)
+
+            if (upper_wick <= LONG_SMALL_WICK_THRESHOLD * h
+                    and lower_wick >= LONG_SIGNAL_WICK_MIN_PERCENT * l
+                    and body_size >= LONG_BODY_SIZE_THRESHOLD * o
+                    and lower_wick > LONG_LOWER_WICK_THRESHOLD * body_size):
+                return "LONG"
 
-        body_size_percent = body_size / o if o > 0 else 0
-        upper_wick_percent = upper_wick / h if h > 0 else 0
-        lower_wick_percent = lower_wick / l if l > 0 else 0
-        wick_to_body_ratio = upper_wick / body_size if body_size > 0 else 0
-        
-        print(f"   [CHECK SHORT]\n"
-              f"   - % Body (so với giá mở cửa):   {body_size_percent:.4%}\n"
-              f"   - % Râu trên (so với giá cao nhất): {upper_wick_percent:.4%}\n"
-              f"   - % Râu dưới (so với giá thấp nhất):  {lower_wick_percent:.4%}\n"
-              f"   - Tỉ lệ Râu trên/Thân:           {wick_to_body_ratio:.2f}")
-
-        cond_body_size = body_size_percent >= SHORT_BODY_SIZE_THRESHOLD
-        cond_wick_ratio = wick_to_body_ratio > SHORT_WICK_THRESHOLD
-        cond_small_lower_wick = lower_wick_percent <= SHORT_SMALL_WICK_THRESHOLD
-        cond_upper_wick_min_percent = upper_wick_percent >= SHORT_SIGNAL_WICK_MIN_PERCENT
-
-        if cond_body_size and cond_wick_ratio and cond_small_lower_wick and cond_upper_wick_min_percent:
-            return True
-        return False
+        return None
     except Exception as e:
-        print(f"Lỗi phân tích nến SHORT: {e}")
+        print(f"Lỗi phân tích nến: {e}")
         traceback.print_exc()
-        return False
+        return None
 
-def analyze_long_signal(candle):
-    # Phân tích tín hiệu LONG
+@njit(cache=True)
+def score_candles(buf, thresh, allow_short, allow_long):
+    """
+    Bản vector hóa của analyze_signal cho nhiều nến cùng lúc.
+    buf: mảng (N, 4) gồm Open, High, Low, Close; thresh: SIGNAL_THRESHOLDS.
+    Trả về (short_mask, long_mask).
+    """
+    o = buf[:, 0]
+    h = buf[:, 1]
+    l = buf[:, 2]
+    c = buf[:, 3]
+    body = c - o
+    body_size = np.abs(body)
+    valid = (l > 0) & (body_size > 0)
+
+    short_upper_wick = h - o
+    short_lower_wick = c - l
+    short_mask = (valid & (body < 0)
+                  & (short_lower_wick <= thresh[2] * l)
+                  & (short_upper_wick >= thresh[3] * h)
+                  & (body_size >= thresh[1] * o)
+                  & (short_upper_wick > thresh[0] * body_size)) & allow_short
+
+    long_lower_wick = o - l
+    long_upper_wick = h - c
+    long_mask = (valid & (body > 0)
+                 & (long_upper_wick <= thresh[6] * h)
+                 & (long_lower_wick >= thresh[7] * l)
+                 & (body_size >= thresh[5] * o)
+                 & (long_lower_wick > thresh[4] * body_size)) & allow_long
+    return short_mask, long_mask
+
+def analyze_signals(candles):
+    # Phân tích danh sách nến, trả về list "SHORT"/"LONG"/None theo thứ tự đầu vào
+    if len(candles) < VECTORIZE_MIN_SYMBOLS:
+        return [analyze_signal(candle) for candle in candles]
     try:
-        o, h, l, c = candle["open"], candle["high"], candle["low"], candle["close"]
-        if c <= o: return False 
-
-        body_size = c - o
-        lower_wick = o - l
-        upper_wick = h - c
-
-        body_size_percent = body_size / o if o > 0 else 0
-        lower_wick_percent = lower_wick / l if l > 0 else 0
-        upper_wick_percent = upper_wick / h if h > 0 else 0
-        wick_to_body_ratio = lower_wick / body_size if body_size > 0 else 0
-
-        print(f"   [CHECK LONG]\n"
-              f"   - % Body (so với giá mở cửa):    {body_size_percent:.4%}\n"
-              f"   - % Râu trên (so với giá cao nhất):  {upper_wick_percent:.4%}\n"
-              f"   - % Râu dưới (soVỚI giá thấp nhất):   {lower_wick_percent:.4%}\n"
-              f"   - Tỉ lệ Râu dưới/Thân:            {wick_to_body_ratio:.2f}")
-
-        cond_body_size = body_size_percent >= LONG_BODY_SIZE_THRESHOLD
-        cond_wick_ratio = wick_to_body_ratio > LONG_LOWER_WICK_THRESHOLD
-        cond_small_upper_wick = upper_wick_percent <= LONG_SMALL_WICK_THRESHOLD
-        cond_lower_wick_min_percent = lower_wick_percent >= LONG_SIGNAL_WICK_MIN_PERCENT
-
-        if cond_body_size and cond_wick_ratio and cond_small_upper_wick and cond_lower_wick_min_percent:
-            return True
-        return False
+        buf = np.array([[cd["open"], cd["high"], cd["low"], cd["close"]] for cd in candles], dtype=np.float64)
+        short_mask, long_mask = score_candles(buf, SIGNAL_THRESHOLDS, ALLOW_SHORT_TRADES, ALLOW_LONG_TRADES)
     except Exception as e:
-        print(f"Lỗi phân tích nến LONG: {e}")
+        print(f"Lỗi phân tích nến theo lô: {e}. Chuyển sang phân tích từng nến.")
         traceback.print_exc()
-        return False
+        return [analyze_signal(candle) for candle in candles]
+    signal_types = ["SHORT" if is_short else "LONG" if is_long else None
+                    for is_short, is_long in zip(short_mask.tolist(), long_mask.tolist())]
+    # Bản lô không tính các chỉ số % như [CHECK SHORT/LONG], chỉ log nến và kết quả
+    if logger.isEnabledFor(logging.DEBUG):
+        for candle, signal_type in zip(candles, signal_types):
+            logger.debug("   [CHECK LÔ] O:%s H:%s L:%s C:%s -> %s",
+                         candle["open"], candle["high"], candle["low"], candle["close"],
+                         signal_type or "Không có tín hiệu")
+    return signal_types
 
 def calculate_position_size(position_size_usdt, entry_price, lot_size, leverage):
     """
@@ -341,7 +658,7 @@ def calculate_position_size(position_size_usdt, entry_price, lot_size, leverage)
     # Làm tròn để tránh sai số float, đảm bảo là bội số của lot_size (0.001)
     adjusted_size = round(adjusted_size, 8) 
     
-    print(f"   [DEBUG SIZE] Raw Size: {raw_size:.8f} | Lots: {number_of_lots} | Adjusted Size: {adjusted_size:.8f}")
+    logger.debug("   [DEBUG SIZE] Raw Size: %.8f | Lots: %d | Adjusted Size: %.8f", raw_size, number_of_lots, adjusted_size)
 
     return adjusted_size
 
@@ -349,11 +666,11 @@ def execute_trade(sym_config, signal_candle, next_candle_open, signal_type):
     # Thực hiện giao dịch
     try:
         balance = get_account_balance()
-        position_size_usdt = sym_config['position_size_usdt']
+        position_size_usdt = sym_config.position_size_usdt
 
         if balance < position_size_usdt:
             print(f"❌ Số dư không đủ: {balance:.2f} USDT (cần {position_size_usdt} USDT)")
-            send_slack_alert(f"💸 Số dư không đủ cho *{sym_config['symbol']}*. Cần {position_size_usdt} USDT nhưng chỉ có {balance:.2f} USDT.")
+            send_slack_alert(f"💸 Số dư không đủ cho *{sym_config.symbol}*. Cần {position_size_usdt} USDT nhưng chỉ có {balance:.2f} USDT.")
             return
         
         entry_price = next_candle_open
@@ -366,7 +683,7 @@ def execute_trade(sym_config, signal_candle, next_candle_open, signal_type):
             if risk <= 0:
                 print(f"❌ Lỗi: Risk (SHORT) không hợp lệ (<= 0). SL: {stop_loss}, Entry: {entry_price}")
                 return
-            tp_price = entry_price - (risk * sym_config['rr_ratio'])
+            tp_price = entry_price - (risk * sym_config.rr_ratio)
             alert_icon = "📉"
             
         elif signal_type == "LONG":
@@ -377,7 +694,7 @@ def execute_trade(sym_config, signal_candle, next_candle_open, signal_type):
             if risk <= 0:
                 print(f"❌ Lỗi: Risk (LONG) không hợp lệ (<= 0). Entry: {entry_price}, SL: {stop_loss}")
                 return
-            tp_price = entry_price + (risk * sym_config['rr_ratio'])
+            tp_price = entry_price + (risk * sym_config.rr_ratio)
             alert_icon = "🚀"
             
         else:
@@ -388,7 +705,7 @@ def execute_trade(sym_config, signal_candle, next_candle_open, signal_type):
         position_size = calculate_position_size(
             position_size_usdt, 
             entry_price, 
-            sym_config['lot_size'],
+            sym_config.lot_size,
             LEVERAGE
         )
         
@@ -396,23 +713,23 @@ def execute_trade(sym_config, signal_candle, next_candle_open, signal_type):
             print(f"❌ Lỗi: Kích thước lệnh quá nhỏ sau khi làm tròn. Cân nhắc tăng 'position_size_usdt'.")
             return
 
-        print(f"🎯 Chuẩn bị đặt lệnh {signal_type} {sym_config['symbol']} | Size: {position_size}")
-        order_result = place_order(sym_config['symbol'], side, posSide, entry_price, stop_loss, tp_price, position_size)
+        print(f"🎯 Chuẩn bị đặt lệnh {signal_type} {sym_config.symbol} | Size: {position_size}")
+        order_result = place_order(sym_config.symbol, side, posSide, entry_price, stop_loss, tp_price, position_size)
         
         if order_result and order_result.get('code') == '0':
             order_id = order_result['data'][0]['ordId']
             print(f"✅ Đặt lệnh thành công! ID: {order_id}")
             with ORDERS_LOCK:
-                pending_orders.append({
+                pending_orders[order_id] = {
                     'orderId': order_id,
-                    'symbol': sym_config['symbol'],
-                    'place_time': datetime.now(ZoneInfo("UTC"))
-                })
-            send_slack_alert(f"{alert_icon} Đã đặt lệnh {signal_type} cho *{sym_config['symbol']}*:\n- Entry: `{entry_price}`\n- SL: `{stop_loss}`\n- TP: `{tp_price}`\n- Size: `{position_size}`\n- ID: `{order_id}`")
+                    'symbol': sym_config.symbol,
+                    'place_time': datetime.now(timezone.utc)
+                }
+            send_slack_alert(f"{alert_icon} Đã đặt lệnh {signal_type} cho *{sym_config.symbol}*:\n- Entry: `{entry_price}`\n- SL: `{stop_loss}`\n- TP: `{tp_price}`\n- Size: `{position_size}`\n- ID: `{order_id}`")
         else:
             print(f"❌ Lỗi đặt lệnh: {order_result}")
             # Báo cáo lỗi đặt lệnh lên Slack
-            send_slack_alert(f"🔥 Lỗi khi đặt lệnh {signal_type} cho *{sym_config['symbol']}*:\n`{order_result}`", is_critical=True)
+            send_slack_alert(f"🔥 Lỗi khi đặt lệnh {signal_type} cho *{sym_config.symbol}*:\n`{order_result}`", is_critical=True)
 
     except Exception as e:
         print(f"❌ Lỗi nghiêm trọng trong execute_trade: {e}")
@@ -420,29 +737,75 @@ def execute_trade(sym_config, signal_candle, next_candle_open, signal_type):
 
 def check_and_cancel_stale_orders():
     # Kiểm tra và hủy lệnh quá hạn
-    global pending_orders
-    print(f"\n🔄 Bắt đầu kiểm tra {len(pending_orders)} lệnh đang chờ...")
+    # Chỉ giữ ORDERS_LOCK khi chụp danh sách và khi xóa, các lệnh gọi API chạy ngoài khóa
     with ORDERS_LOCK:
-        if not pending_orders: return
-        orders_to_remove = []
-        for order in pending_orders:
-            if (datetime.now(ZoneInfo("UTC")) - order['place_time']).total_seconds() > ORDER_TIMEOUT_MINUTES * 60:
-                print(f"   - Lệnh {order['orderId']} ({order['symbol']}) đã quá hạn...")
-                status_result = get_order_status(order['symbol'], order['orderId'])
-                if status_result and status_result.get('code') == '0':
-                    state = status_result['data'][0].get('state')
-                    if state == 'live':
-                        print("     -> Đang hủy lệnh...")
-                        cancel_result = cancel_order(order['symbol'], order['orderId'])
-                        if cancel_result and cancel_result.get('code') == '0':
-                            print(f"     ✅ Đã hủy lệnh {order['orderId']} thành công.")
-                            send_slack_alert(f"🚫 Đã tự động hủy lệnh cho *{order['symbol']}* (ID: `{order['orderId']}`) vì quá hạn.")
-                            orders_to_remove.append(order)
-                    else:
-                        print(f"     -> Trạng thái: {state.upper()}. Xóa khỏi danh sách.")
-                        orders_to_remove.append(order)
-        if orders_to_remove:
-            pending_orders = [o for o in pending_orders if o not in orders_to_remove]
+        snapshot = list(pending_orders.values())
+    print(f"\n🔄 Bắt đầu kiểm tra {len(snapshot)} lệnh đang chờ...")
+    if not snapshot: return
+
+    orders_to_remove = []
+    now_utc = datetime.now(timezone.utc)
+    stale_orders = [
+        order for order in snapshot
+        if (now_utc - order['place_time']).total_seconds() > ORDER_TIMEOUT_SECONDS
+    ]
+    # Lấy trạng thái các lệnh quá hạn song song, bước hủy lệnh vẫn chạy tuần tự
+    status_futures = {
+        EXECUTOR.submit(get_order_status, order['symbol'], order['orderId']): order
+        for order in stale_orders
+    }
+    for future in as_completed(status_futures):
+        order = status_futures[future]
+        print(f"   - Lệnh {order['orderId']} ({order['symbol']}) đã quá hạn...")
+        status_result = future.result()
+        if status_result and status_result.get('code') == '0':
+            state = status_result['data'][0].get('state')
+            if state == 'live':
+                print("     -> Đang hủy lệnh...")
+                cancel_result = cancel_order(order['symbol'], order['orderId'])
+                if cancel_result and cancel_result.get('code') == '0':
+                    print(f"     ✅ Đã hủy lệnh {order['orderId']} thành công.")
+                    send_slack_alert(f"🚫 Đã tự động hủy lệnh cho *{order['symbol']}* (ID: `{order['orderId']}`) vì quá hạn.")
+                    orders_to_remove.append(order['orderId'])
+            else:
+                print(f"     -> Trạng thái: {state.upper()}. Xóa khỏi danh sách.")
+                orders_to_remove.append(order['orderId'])
+
+    if orders_to_remove:
+        with ORDERS_LOCK:
+            for order_id in orders_to_remove:
+                pending_orders.pop(order_id, None)
+
+def get_profit_target_1_1(pos_side, entry_price, sl_price):
+    # Giá mục tiêu 1:1 của vị thế, None nếu SL không nằm phía rủi ro
+    if pos_side == 'long':
+        risk_amount = entry_price - sl_price
+        return entry_price + risk_amount if risk_amount > 0 else None
+    if pos_side == 'short':
+        risk_amount = sl_price - entry_price
+        return entry_price - risk_amount if risk_amount > 0 else None
+    return None
+
+def reached_profit_target(pos_side, current_price, profit_target):
+    # Giá hiện tại đã chạm mục tiêu 1:1 hay chưa
+    if pos_side == 'long':
+        return current_price >= profit_target
+    return current_price <= profit_target
+
+def _mark_sl_at_entry(key, sl_order, entry_price):
+    # Ghi nhận SL đã ở entry (gọi khi đang giữ _SL_STATE_LOCK)
+    _SL_STATE[key] = {**sl_order, 'slTriggerPx': str(entry_price)}
+    _SL_MOVED_AT[key] = time.monotonic()
+
+def move_sl_to_entry(symbol, pos_side, sl_algo_id, entry_price):
+    # Dời SL về entry và báo Slack, trả về True nếu thành công
+    result = modify_algo_order_sl(symbol, sl_algo_id, entry_price)
+    if result and result.get('code') == '0':
+        send_slack_alert(f"✅ Đã dời SL về Entry cho *{symbol} ({pos_side.upper()})*.\n- Entry: `{entry_price}`")
+        return True
+    print(f"     ❌ Lỗi dời SL: {result}")
+    send_slack_alert(f"🔥 Lỗi khi dời SL cho *{symbol} ({pos_side.upper()})*:\n`{result}`", is_critical=True)
+    return False
 
 def manage_position_sl_to_entry():
     # Quản lý dời SL về điểm hòa vốn (entry)
@@ -453,19 +816,45 @@ def manage_position_sl_to_entry():
             print("   - Không có vị thế nào đang mở.")
             return
 
-        for pos in open_positions:
+        # Lấy ticker của các vị thế song song, lệnh SL của tất cả vị thế trong một lần gọi
+        fetch_started = time.monotonic()
+        sl_future = EXECUTOR.submit(get_all_pending_algo_orders, "sl")
+        market_futures = {
+            EXECUTOR.submit(get_market_ticker, pos['instId']): pos
+            for pos in open_positions
+        }
+        sl_orders_by_position = sl_future.result()
+        if sl_orders_by_position is None:
+            print("   - Không lấy được lệnh SL (algo), thử lại ở chu kỳ sau.")
+            return
+
+        # Cập nhật trạng thái SL dùng cho luồng sự kiện WebSocket.
+        # Giữ nguyên các vị thế đang được dời hoặc vừa dời sau khi bắt đầu lấy danh sách (dữ liệu REST đã cũ).
+        with _SL_STATE_LOCK:
+            newer = {
+                key: sl_order for key, sl_order in _SL_STATE.items()
+                if key in _SL_MOVING or _SL_MOVED_AT.get(key, 0) >= fetch_started
+            }
+            _SL_STATE.clear()
+            _SL_RETRY_AT.clear()
+            for key, sl_orders in sl_orders_by_position.items():
+                _SL_STATE[key] = sl_orders[0]
+            _SL_STATE.update(newer)
+
+        for future in as_completed(market_futures):
+            pos = market_futures[future]
             symbol = pos['instId']
             pos_side = pos['posSide'] # 'long' or 'short'
             entry_price = float(pos['avgPx']) 
             
             print(f"   - Đang kiểm tra vị thế {symbol} ({pos_side.upper()}) | Entry: {entry_price}")
 
-            current_price = get_market_ticker(symbol)
+            current_price = future.result()
             if not current_price:
                 print(f"     -> Lỗi: Không lấy được giá ticker cho {symbol}")
                 continue
 
-            sl_orders = get_pending_algo_orders(symbol, pos_side, order_type="sl")
+            sl_orders = sl_orders_by_position.get((symbol, pos_side))
             if not sl_orders:
                 print(f"     -> Không tìm thấy lệnh SL (algo) đang 'live' cho vị thế này.")
                 continue
@@ -478,40 +867,30 @@ def manage_position_sl_to_entry():
                 print(f"     -> SL đã ở điểm entry. Bỏ qua.")
                 continue
 
-            risk_amount = 0
-            profit_target_1_1 = 0
-            
-            if pos_side == 'long':
-                risk_amount = entry_price - original_sl_price
-                if risk_amount <= 0: continue 
-                profit_target_1_1 = entry_price + risk_amount
-                
-                if current_price >= profit_target_1_1:
-                    print(f"     ✅ LONG ĐẠT 1:1 (Giá: {current_price} >= {profit_target_1_1}). Dời SL về {entry_price}")
-                    result = modify_algo_order_sl(symbol, sl_algo_id, entry_price)
-                    if result and result.get('code') == '0':
-                        send_slack_alert(f"✅ Đã dời SL về Entry cho *{symbol} (LONG)*.\n- Entry: `{entry_price}`")
-                    else:
-                        print(f"     ❌ Lỗi dời SL: {result}")
-                        send_slack_alert(f"🔥 Lỗi khi dời SL cho *{symbol} (LONG)*:\n`{result}`", is_critical=True)
-                else:
-                    print(f"     -> LONG chưa đạt 1:1 (Giá: {current_price} < {profit_target_1_1})")
-
-            elif pos_side == 'short':
-                risk_amount = original_sl_price - entry_price
-                if risk_amount <= 0: continue
-                profit_target_1_1 = entry_price - risk_amount
-                
-                if current_price <= profit_target_1_1:
-                    print(f"     ✅ SHORT ĐẠT 1:1 (Giá: {current_price} <= {profit_target_1_1}). Dời SL về {entry_price}")
-                    result = modify_algo_order_sl(symbol, sl_algo_id, entry_price)
-                    if result and result.get('code') == '0':
-                        send_slack_alert(f"✅ Đã dời SL về Entry cho *{symbol} (SHORT)*.\n- Entry: `{entry_price}`")
-                    else:
-                        print(f"     ❌ Lỗi dời SL: {result}")
-                        send_slack_alert(f"🔥 Lỗi khi dời SL cho *{symbol} (SHORT)*:\n`{result}`", is_critical=True)
-                else:
-                    print(f"     -> SHORT chưa đạt 1:1 (Giá: {current_price} > {profit_target_1_1})")
+            profit_target_1_1 = get_profit_target_1_1(pos_side, entry_price, original_sl_price)
+            if profit_target_1_1 is None: continue
+
+            if reached_profit_target(pos_side, current_price, profit_target_1_1):
+                with _SL_STATE_LOCK:
+                    if (symbol, pos_side) in _SL_MOVING:
+                        print(f"     -> SL đang được dời bởi luồng sự kiện WebSocket. Bỏ qua.")
+                        continue
+                    # Kiểm tra lại: luồng sự kiện có thể đã dời SL sau khi lấy danh sách REST
+                    cached_sl_order = _SL_STATE.get((symbol, pos_side))
+                    if cached_sl_order and float(cached_sl_order['slTriggerPx']) == entry_price:
+                        print(f"     -> SL vừa được dời về entry bởi luồng sự kiện WebSocket. Bỏ qua.")
+                        continue
+                    _SL_MOVING.add((symbol, pos_side))
+                print(f"     ✅ {pos_side.upper()} ĐẠT 1:1 (Giá: {current_price} | Mục tiêu: {profit_target_1_1}). Dời SL về {entry_price}")
+                try:
+                    if move_sl_to_entry(symbol, pos_side, sl_algo_id, entry_price):
+                        with _SL_STATE_LOCK:
+                            _mark_sl_at_entry((symbol, pos_side), sl_order, entry_price)
+                finally:
+                    with _SL_STATE_LOCK:
+                        _SL_MOVING.discard((symbol, pos_side))
+            else:
+                print(f"     -> {pos_side.upper()} chưa đạt 1:1 (Giá: {current_price} | Mục tiêu: {profit_target_1_1})")
                     
     except Exception as e:
         print(f"❌ Lỗi nghiêm trọng trong lúc quản lý dời SL: {e}")
@@ -519,31 +898,181 @@ def manage_position_sl_to_entry():
         send_slack_alert(f"🔥 Lỗi nghiêm trọng khi chạy `manage_position_sl_to_entry`:\n`{traceback.format_exc()}`", is_critical=True)
 
 
+# ==============================================================================
+# ========== LUỒNG SỰ KIỆN WEBSOCKET (POSITIONS & ORDERS) ==========
+# ==============================================================================
+
+_PRIVATE_WS_READY = threading.Event()  # Đã đăng nhập và đăng ký kênh positions
+
+def _ws_login_message():
+    # Đăng nhập WS private bằng cùng chữ ký HMAC với REST
+    timestamp = str(int(time.time()))
+    return orjson.dumps({"op": "login", "args": [{
+        "apiKey": _CFG.okx_api_key, "passphrase": _CFG.okx_passphrase, "timestamp": timestamp,
+        "sign": okx_signature(timestamp, "GET", "/users/self/verify")
+    }]}).decode()
+
+def _get_sl_order(key):
+    # Lấy lệnh SL của vị thế từ cache, chỉ gọi REST khi vị thế chưa có trong cache.
+    # Lỗi API hoặc chưa thấy lệnh SL: không lưu cache, chờ SL_RETRY_BACKOFF_SECONDS rồi tra lại.
+    with _SL_STATE_LOCK:
+        if key in _SL_STATE:
+            return _SL_STATE[key]
+    sl_orders_by_position = get_all_pending_algo_orders("sl")
+    with _SL_STATE_LOCK:
+        if sl_orders_by_position is not None:
+            for pos_key, sl_orders in sl_orders_by_position.items():
+                _SL_STATE[pos_key] = sl_orders[0]
+        sl_order = _SL_STATE.get(key)
+        if sl_order is None:
+            _SL_RETRY_AT[key] = time.time() + SL_RETRY_BACKOFF_SECONDS
+        return sl_order
+
+def _sl_event_target(key, sl_order, entry_price, current_price):
+    # Giá mục tiêu 1:1 nếu cần dời SL ngay, None nếu chưa cần
+    original_sl_price = float(sl_order['slTriggerPx'])
+    if original_sl_price == entry_price:
+        return None
+    profit_target_1_1 = get_profit_target_1_1(key[1], entry_price, original_sl_price)
+    if profit_target_1_1 is None or not reached_profit_target(key[1], current_price, profit_target_1_1):
+        return None
+    return profit_target_1_1
+
+def _process_position_event(key, entry_price, current_price):
+    # Chạy trên EXECUTOR để không chặn luồng WS: tra SL (nếu cần) và dời SL khi giá đạt 1:1
+    symbol, pos_side = key
+    try:
+        sl_order = _get_sl_order(key)
+        if not sl_order:
+            return
+        profit_target_1_1 = _sl_event_target(key, sl_order, entry_price, current_price)
+        if profit_target_1_1 is None:
+            return
+        print(f"🔔 [WS] {symbol} {pos_side.upper()} ĐẠT 1:1 (Giá: {current_price} | Mục tiêu: {profit_target_1_1}). Dời SL về {entry_price}")
+        moved = move_sl_to_entry(symbol, pos_side, sl_order['algoId'], entry_price)
+        with _SL_STATE_LOCK:
+            if moved:
+                _mark_sl_at_entry(key, sl_order, entry_price)
+            else:
+                # Thất bại: tra lại SL từ REST sau một khoảng chờ ngắn
+                _SL_STATE.pop(key, None)
+                _SL_RETRY_AT[key] = time.time() + SL_RETRY_BACKOFF_SECONDS
+    except Exception as e:
+        print(f"❌ Lỗi xử lý sự kiện vị thế {symbol} ({pos_side}): {e}")
+        traceback.print_exc()
+    finally:
+        with _SL_STATE_LOCK:
+            _SL_MOVING.discard(key)
+
+def _on_position_update(pos):
+    # Xử lý sự kiện vị thế trên luồng WS (không gọi REST): chỉ chuyển việc sang EXECUTOR khi cần
+    key = (pos.get('instId'), pos.get('posSide'))
+    if float(pos.get('pos') or 0) == 0:
+        with _SL_STATE_LOCK:
+            _SL_STATE.pop(key, None)
+            _SL_RETRY_AT.pop(key, None)
+            _SL_MOVED_AT.pop(key, None)
+        return
+    price = pos.get('last') or pos.get('markPx')
+    if not price or not pos.get('avgPx'):
+        return
+    entry_price = float(pos['avgPx'])
+    current_price = float(price)
+
+    with _SL_STATE_LOCK:
+        if key in _SL_MOVING or time.time() < _SL_RETRY_AT.get(key, 0):
+            return
+        sl_order = _SL_STATE.get(key)
+        if sl_order and _sl_event_target(key, sl_order, entry_price, current_price) is None:
+            return
+        _SL_MOVING.add(key)
+    EXECUTOR.submit(_process_position_event, key, entry_price, current_price)
+
+def _on_order_update(order):
+    # Xử lý sự kiện lệnh: xóa lệnh đã khớp/hủy khỏi danh sách chờ, làm mới SL khi lệnh khớp
+    state = order.get('state')
+    if state in ('filled', 'canceled', 'mmp_canceled'):
+        with ORDERS_LOCK:
+            removed = pending_orders.pop(order.get('ordId'), None)
+        if removed:
+            print(f"🔔 [WS] Lệnh {removed['orderId']} ({removed['symbol']}) chuyển sang {state.upper()}. Xóa khỏi danh sách chờ.")
+    if state in ('filled', 'partially_filled'):
+        key = (order.get('instId'), order.get('posSide'))
+        with _SL_STATE_LOCK:
+            _SL_STATE.pop(key, None)
+            _SL_RETRY_AT.pop(key, None)
+
+def _private_stream_worker():
+    # Luồng nền: đăng nhập WS private và theo dõi kênh positions/orders
+    subscribe_msg = orjson.dumps({"op": "subscribe", "args": [
+        {"channel": "positions", "instType": "SWAP"},
+        {"channel": "orders", "instType": "SWAP"}
+    ]}).decode()
+
+    def on_message(ws, msg):
+        event = msg.get('event')
+        if event == 'login':
+            if msg.get('code') == '0':
+                ws.send(subscribe_msg)
+            else:
+                print(f"❌ Lỗi đăng nhập WebSocket private: {msg}")
+            return
+        if event == 'subscribe':
+            if msg.get('arg', {}).get('channel') == 'positions':
+                _PRIVATE_WS_READY.set()
+            return
+        if event == 'error':
+            print(f"❌ Lỗi WebSocket private: {msg}")
+            return
+        channel = msg.get('arg', {}).get('channel')
+        for item in msg.get('data') or []:
+            if channel == 'positions':
+                _on_position_update(item)
+            elif channel == 'orders':
+                _on_order_update(item)
+
+    _ws_loop(OKX_WS_PRIVATE_URL, "private (positions/orders)",
+             lambda ws: ws.send(_ws_login_message()), on_message, _PRIVATE_WS_READY.clear)
+
+def start_private_stream():
+    # Khởi chạy luồng WebSocket private trong nền
+    threading.Thread(target=_private_stream_worker, daemon=True).start()
+
+
 # ==============================================================================
 # ========== TÁC VỤ CHÍNH VÀ LẬP LỊCH ==========
 # ==============================================================================
 
 def trading_bot_task():
     """Hàm chính thực hiện toàn bộ logic quét và giao dịch."""
-    print(f"\n{'='*50}\n🕒 Bắt đầu chu kỳ quét lúc: {datetime.now(VIETNAM_TIMEZONE).strftime('%Y-%m-%d %H:%M:%S')}\n{'='*50}")
-    for sym_config in SYMBOLS:
-        symbol = sym_config['symbol']
+    refresh_vn_offset()
+    print(f"\n{'='*50}\n🕒 Bắt đầu chu kỳ quét lúc: {fmt_vn()}\n{'='*50}")
+    # Tải nến của tất cả symbol song song trước khi phân tích
+    candle_futures = [
+        (sym_config, EXECUTOR.submit(fetch_signal_candle, sym_config.symbol))
+        for sym_config in SYMBOLS
+    ]
+    candidates = []  # (sym_config, signal_candle) đã qua điều kiện volume
+    for sym_config, candle_future in candle_futures:
+        symbol = sym_config.symbol
         print(f"🔍 Đang phân tích {symbol}...")
         
         # Nhận 2 nến: tín hiệu (data[0]) và nến trước (data[1])
-        signal_candle, prev_candle = fetch_signal_candle(symbol)
+        signal_candle, prev_candle = candle_future.result()
         
         # Kiểm tra tính hợp lệ của dữ liệu nến
         if not signal_candle or not prev_candle:
             continue
             
-        print(f"   --- Thông tin nến tín hiệu (data[0]) ---")
-        print(f"   - Mở cửa (Open):   {signal_candle['open']}")
-        print(f"   - Cao nhất (High):  {signal_candle['high']}")
-        print(f"   - Thấp nhất (Low):   {signal_candle['low']}")
-        print(f"   - Đóng cửa (Close): {signal_candle['close']}")
-        print(f"   - Volume: {signal_candle['volume']:.2f} | Volume nến trước: {prev_candle['volume']:.2f}")
-        print(f"   -------------------------------")
+        logger.debug("   --- Thông tin nến tín hiệu (data[0]) ---\n"
+                     "   - Mở cửa (Open):   %s\n"
+                     "   - Cao nhất (High):  %s\n"
+                     "   - Thấp nhất (Low):   %s\n"
+                     "   - Đóng cửa (Close): %s\n"
+                     "   - Volume: %.2f | Volume nến trước: %.2f\n"
+                     "   -------------------------------",
+                     signal_candle['open'], signal_candle['high'], signal_candle['low'],
+                     signal_candle['close'], signal_candle['volume'], prev_candle['volume'])
 
         # ĐIỀU KIỆN MỚI: Volume nến tín hiệu (data[0]) phải lớn hơn nến trước (data[1])
         is_high_volume = signal_candle['volume'] > prev_candle['volume']
@@ -553,46 +1082,44 @@ def trading_bot_task():
             continue
             
         print("   ✅ Đã đạt điều kiện Volume (Volume hiện tại > Volume trước đó). Tiếp tục kiểm tra tín hiệu...")
-
-
-        is_signal_short = False
-        is_signal_long = False
-
-        if ALLOW_SHORT_TRADES:
-            is_signal_short = analyze_short_signal(signal_candle)
-            
-        if ALLOW_LONG_TRADES:
-            is_signal_long = analyze_long_signal(signal_candle)
-
-        if is_signal_short:
-            print(f"   ⚡ PHÁT HIỆN: Tín hiệu SHORT hợp lệ!")
-            execute_trade(sym_config, signal_candle, signal_candle['close'], "SHORT")
-        elif is_signal_long:
-            print(f"   ⚡ PHÁT HIỆN: Tín hiệu LONG hợp lệ!")
-            execute_trade(sym_config, signal_candle, signal_candle['close'], "LONG")
+        candidates.append((sym_config, signal_candle))
+
+    # Phân tích tín hiệu của tất cả symbol hợp lệ trong một lần
+    signal_types = analyze_signals([signal_candle for _, signal_candle in candidates])
+    for (sym_config, signal_candle), signal_type in zip(candidates, signal_types):
+        if signal_type:
+            print(f"   ⚡ PHÁT HIỆN: Tín hiệu {signal_type} hợp lệ cho {sym_config.symbol}!")
+            execute_trade(sym_config, signal_candle, signal_candle['close'], signal_type)
         else:
-            print(f"   - Không có tín hiệu nến phù hợp.")
+            print(f"   - {sym_config.symbol}: Không có tín hiệu nến phù hợp.")
+
 
+def seconds_until_next_run(now_utc):
+    # Tính số giây còn lại đến mốc chạy kế tiếp (phút chia hết cho 5, giây thứ 3)
+    next_run = now_utc.replace(minute=now_utc.minute - now_utc.minute % 5, second=3, microsecond=0)
+    if next_run <= now_utc:
+        next_run += timedelta(minutes=5)
+    return (next_run - now_utc).total_seconds()
 
 def scheduled_task():
-    # Tác vụ lập lịch chạy tự động mỗi 5 phút
+    # Tác vụ lập lịch chạy tự động mỗi 5 phút (ngủ một lần đến mốc kế tiếp, không polling)
+    cycle = 0
     while True:
-        now_utc = datetime.now(ZoneInfo("UTC"))
-        if now_utc.minute % 5 == 0 and now_utc.second == 3:
-            try:
-                trading_bot_task() 
-                check_and_cancel_stale_orders()
+        time.sleep(seconds_until_next_run(datetime.now(timezone.utc)))
+        cycle += 1
+        try:
+            trading_bot_task() 
+            check_and_cancel_stale_orders()
+            # WS private đang chạy thì SL được dời theo sự kiện, REST chỉ đối soát định kỳ
+            if not _PRIVATE_WS_READY.is_set() or cycle % SL_RECONCILE_EVERY_CYCLES == 0:
                 manage_position_sl_to_entry() 
-                
-            except Exception as e:
-                error_msg = f"LỖI NGHIÊM TRỌNG TRONG SCHEDULED TASK:\n{e}\n{traceback.format_exc()}"
-                print(error_msg)
-                send_slack_alert(f"```{error_msg}```", is_critical=True)
-            finally:
-                print("\n⏳ Chu kỳ hoàn tất, chờ 5 phút tiếp theo...")
-                time.sleep(60)
-        else:
-            time.sleep(0.5)
+            
+        except Exception as e:
+            error_msg = f"LỖI NGHIÊM TRỌNG TRONG SCHEDULED TASK:\n{e}\n{traceback.format_exc()}"
+            print(error_msg)
+            send_slack_alert(f"```{error_msg}```", is_critical=True)
+        finally:
+            print("\n⏳ Chu kỳ hoàn tất, chờ 5 phút tiếp theo...")
 
 # ==============================================================================
 # ========== GIAO DIỆN VÀ KHỞI CHẠY ==========
@@ -603,10 +1130,18 @@ def run_manual_check():
     threading.Thread(target=trading_bot_task).start()
     threading.Thread(target=check_and_cancel_stale_orders).start()
     threading.Thread(target=manage_position_sl_to_entry).start()
-    return f"🟢 Đã kích hoạt kiểm tra thủ công lúc: {datetime.now(VIETNAM_TIMEZONE).strftime('%H:%M:%S')}"
+    return f"🟢 Đã kích hoạt kiểm tra thủ công lúc: {fmt_vn('%H:%M:%S')}"
 
 def main():
     # Hàm khởi chạy chính
+    cfg = _load_config()
+    if not cfg.is_complete():
+        print("❌ Lỗi: Vui lòng thiết lập đầy đủ OKX_API_KEY, OKX_SECRET_KEY, và OKX_PASSPHRASE trong file .env")
+        exit(1)
+    _apply_config(cfg)
+    start_candle_stream([sym_config.symbol for sym_config in SYMBOLS])
+    start_private_stream()
+
     print("🟢 Bot đang khởi chạy...")    
     scheduler_thread = threading.Thread(target=scheduled_task, daemon=True)
     scheduler_thread.start()
@@ -0,0 +1,17 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+for _dep in ("numpy", "requests", "gradio", "dotenv", "orjson", "websocket"):
+    pytest.importorskip(_dep)
+
+APP_PATH = Path(__file__).resolve().parent.parent / "app (3).py"
+
+
+@pytest.fixture(scope="module")
+def app():
+    spec = importlib.util.spec_from_file_location("autolongshort_app", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
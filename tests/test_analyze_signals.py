@@ -0,0 +1,33 @@
+import random
+
+
+def random_candles(n, seed):
+    rng = random.Random(seed)
+    candles = []
+    for _ in range(n):
+        o = 100 + rng.uniform(-1, 1)
+        c = 100 + rng.uniform(-1, 1)
+        h = max(o, c) + rng.choice([0, rng.uniform(0, 0.6)])
+        l = min(o, c) - rng.choice([0, rng.uniform(0, 0.6), rng.uniform(0, 0.03)])
+        candles.append({"open": o, "high": h, "low": l, "close": c, "volume": 1.0})
+    return candles
+
+
+def test_vectorized_matches_scalar(app):
+    candles = random_candles(20000, seed=1)
+    assert len(candles) >= app.VECTORIZE_MIN_SYMBOLS
+    expected = [app.analyze_signal(candle) for candle in candles]
+    assert app.analyze_signals(candles) == expected
+    assert {"SHORT", "LONG"} <= set(expected)
+
+
+def test_small_batch_uses_scalar_path(app):
+    candles = random_candles(app.VECTORIZE_MIN_SYMBOLS - 1, seed=2)
+    assert app.analyze_signals(candles) == [app.analyze_signal(candle) for candle in candles]
+
+
+def test_doji_and_invalid_low_have_no_signal(app):
+    doji = {"open": 100.0, "high": 101.0, "low": 99.0, "close": 100.0}
+    bad_low = {"open": 100.0, "high": 101.0, "low": 0.0, "close": 99.0}
+    candles = [doji, bad_low] * app.VECTORIZE_MIN_SYMBOLS
+    assert app.analyze_signals(candles) == [None] * len(candles)
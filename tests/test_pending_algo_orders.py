@@ -0,0 +1,39 @@
+def make_orders(n):
+    return [
+        {"instId": f"SYM{i}-USDT-SWAP", "posSide": "long", "state": "live", "algoId": str(10000 - i)}
+        for i in range(n)
+    ]
+
+
+def paged_okx_request(orders, calls):
+    def fake_okx_request(method, endpoint, params=None, body=None):
+        calls.append(dict(params))
+        start = 0
+        if "after" in params:
+            start = next(i for i, o in enumerate(orders) if o["algoId"] == params["after"]) + 1
+        return {"code": "0", "data": orders[start:start + int(params["limit"])]}
+    return fake_okx_request
+
+
+def test_reads_every_page(app, monkeypatch):
+    orders = make_orders(230)
+    calls = []
+    monkeypatch.setattr(app, "okx_request", paged_okx_request(orders, calls))
+    result = app.get_all_pending_algo_orders("sl")
+    assert len(result) == 230
+    assert [c.get("after") for c in calls] == [None, orders[99]["algoId"], orders[199]["algoId"]]
+
+
+def test_exactly_full_page_requests_one_more(app, monkeypatch):
+    orders = make_orders(app.ALGO_ORDERS_PAGE_LIMIT)
+    calls = []
+    monkeypatch.setattr(app, "okx_request", paged_okx_request(orders, calls))
+    assert len(app.get_all_pending_algo_orders("sl")) == app.ALGO_ORDERS_PAGE_LIMIT
+    assert len(calls) == 2
+
+
+def test_error_on_later_page_returns_none(app, monkeypatch):
+    orders = make_orders(150)
+    responses = iter([{"code": "0", "data": orders[:100]}, None])
+    monkeypatch.setattr(app, "okx_request", lambda *a, **k: next(responses))
+    assert app.get_all_pending_algo_orders("sl") is None
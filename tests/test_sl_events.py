@@ -0,0 +1,144 @@
+import pytest
+
+
+SYMBOL = "BTC-USDT-SWAP"
+KEY = (SYMBOL, "long")
+SL_ORDER = {"instId": SYMBOL, "posSide": "long", "state": "live", "slTriggerPx": "90", "algoId": "a1"}
+
+
+@pytest.fixture(autouse=True)
+def clean_state(app):
+    for state in (app._SL_STATE, app._SL_MOVING, app._SL_RETRY_AT, app._SL_MOVED_AT, app.pending_orders):
+        state.clear()
+    yield
+    for state in (app._SL_STATE, app._SL_MOVING, app._SL_RETRY_AT, app._SL_MOVED_AT, app.pending_orders):
+        state.clear()
+
+
+@pytest.fixture
+def amends(app, monkeypatch):
+    calls = []
+
+    def fake_modify(symbol, algo_id, new_sl_price):
+        calls.append((symbol, algo_id, new_sl_price))
+        return {"code": "0", "data": [{}]}
+
+    monkeypatch.setattr(app, "modify_algo_order_sl", fake_modify)
+    return calls
+
+
+def test_reconciler_keeps_sl_moved_during_fetch(app, monkeypatch, amends):
+    monkeypatch.setattr(app, "get_open_positions",
+                        lambda: [{"instId": SYMBOL, "posSide": "long", "avgPx": "100", "pos": "1"}])
+    monkeypatch.setattr(app, "get_market_ticker", lambda symbol: 111.0)
+
+    def fetch_while_event_moves(order_type="sl"):
+        # Luồng sự kiện dời SL trong lúc REST đang trả về ảnh chụp cũ
+        with app._SL_STATE_LOCK:
+            app._mark_sl_at_entry(KEY, SL_ORDER, 100.0)
+        return {KEY: [dict(SL_ORDER)]}
+
+    monkeypatch.setattr(app, "get_all_pending_algo_orders", fetch_while_event_moves)
+    app.manage_position_sl_to_entry()
+    assert amends == []
+    assert float(app._SL_STATE[KEY]["slTriggerPx"]) == 100.0
+
+
+class ImmediateExecutor:
+    """Chạy tác vụ ngay trên luồng gọi để kiểm tra tuần tự."""
+
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, fn, *args, **kwargs):
+        self.submitted += 1
+        fn(*args, **kwargs)
+
+
+@pytest.fixture
+def executor(app, monkeypatch):
+    executor = ImmediateExecutor()
+    monkeypatch.setattr(app, "EXECUTOR", executor)
+    return executor
+
+
+class LookupCalls(list):
+    """Danh sách lần gọi get_all_pending_algo_orders, kèm các phản hồi định sẵn."""
+
+    def __init__(self):
+        super().__init__()
+        self.responses = []
+
+
+@pytest.fixture
+def lookups(app, monkeypatch):
+    calls = LookupCalls()
+
+    def fake_lookup(order_type="sl"):
+        calls.append(order_type)
+        return calls.responses.pop(0) if calls.responses else {KEY: [dict(SL_ORDER)]}
+
+    monkeypatch.setattr(app, "get_all_pending_algo_orders", fake_lookup)
+    return calls
+
+
+def position_push(last, pos="1"):
+    return {"instId": SYMBOL, "posSide": "long", "pos": pos, "avgPx": "100", "last": str(last)}
+
+
+def test_cached_sl_below_target_makes_no_rest_call(app, executor, lookups, amends):
+    app._SL_STATE[KEY] = dict(SL_ORDER)
+    app._on_position_update(position_push(105))
+    assert executor.submitted == 0
+    assert lookups == []
+    assert amends == []
+
+
+def test_uncached_sl_looks_up_once_then_backs_off(app, executor, lookups, amends):
+    lookups.responses.append(None)  # Lỗi API
+    app._on_position_update(position_push(111))
+    app._on_position_update(position_push(112))
+    assert lookups == ["sl"]
+    assert KEY not in app._SL_STATE
+    assert app._SL_RETRY_AT[KEY] > app.time.time()
+    assert amends == []
+
+
+def test_uncached_sl_reaching_target_is_moved(app, executor, lookups, amends):
+    app._on_position_update(position_push(111))
+    assert lookups == ["sl"]
+    assert amends == [(SYMBOL, "a1", 100.0)]
+    assert float(app._SL_STATE[KEY]["slTriggerPx"]) == 100.0
+    assert KEY not in app._SL_MOVING
+
+
+def test_failed_amend_backs_off(app, monkeypatch, executor, lookups):
+    amend_calls = []
+    monkeypatch.setattr(app, "modify_algo_order_sl",
+                        lambda *args: amend_calls.append(args) or {"code": "51000"})
+    app._SL_STATE[KEY] = dict(SL_ORDER)
+    app._on_position_update(position_push(111))
+    app._on_position_update(position_push(112))
+    assert len(amend_calls) == 1
+    assert KEY not in app._SL_STATE
+    assert app._SL_RETRY_AT[KEY] > app.time.time()
+    assert KEY not in app._SL_MOVING
+
+
+def test_closed_position_clears_state(app, executor, lookups):
+    app._SL_STATE[KEY] = dict(SL_ORDER)
+    app._SL_RETRY_AT[KEY] = app.time.time() + 60
+    app._on_position_update(position_push(111, pos="0"))
+    assert KEY not in app._SL_STATE
+    assert KEY not in app._SL_RETRY_AT
+    assert executor.submitted == 0
+
+
+def test_fill_invalidates_cache(app):
+    app._SL_STATE[KEY] = dict(SL_ORDER)
+    app._SL_RETRY_AT[KEY] = app.time.time() + 60
+    app.pending_orders["o1"] = {"orderId": "o1", "symbol": SYMBOL, "place_time": None}
+    app._on_order_update({"ordId": "o1", "state": "filled", "instId": SYMBOL, "posSide": "long"})
+    assert "o1" not in app.pending_orders
+    assert KEY not in app._SL_STATE
+    assert KEY not in app._SL_RETRY_AT
@@ -0,0 +1,62 @@
+import pytest
+
+
+class FakeTimeoutWS:
+    """Kết nối nửa mở: send() luôn thành công, recv() luôn hết hạn."""
+
+    def __init__(self, timeout_exc):
+        self.timeout_exc = timeout_exc
+        self.sent = []
+        self.closed = False
+
+    def send(self, message):
+        self.sent.append(message)
+
+    def recv(self):
+        raise self.timeout_exc()
+
+    def close(self):
+        self.closed = True
+
+
+class StopLoop(BaseException):
+    """Thoát khỏi vòng lặp vô hạn của _ws_loop (không bị except Exception bắt)."""
+
+
+def test_missing_pong_forces_reconnect(app, monkeypatch):
+    ws = FakeTimeoutWS(app.websocket.WebSocketTimeoutException)
+    disconnects = []
+    monkeypatch.setattr(app.websocket, "create_connection", lambda *a, **k: ws)
+
+    def stop_sleep(seconds):
+        raise StopLoop
+
+    monkeypatch.setattr(app.time, "sleep", stop_sleep)
+    with pytest.raises(StopLoop):
+        app._ws_loop("wss://example", "test", lambda w: None, lambda w, m: None,
+                     lambda: disconnects.append(True))
+    assert ws.sent == ["ping"]
+    assert ws.closed
+    assert disconnects == [True]
+
+
+def test_pong_keeps_connection(app, monkeypatch):
+    script = ["timeout", "pong", "timeout", "pong", "stop"]
+
+    class PongWS(FakeTimeoutWS):
+        def recv(self):
+            step = script.pop(0)
+            if step == "timeout":
+                raise self.timeout_exc()
+            if step == "stop":
+                raise StopLoop
+            return step
+
+    ws = PongWS(app.websocket.WebSocketTimeoutException)
+    sleeps = []
+    monkeypatch.setattr(app.websocket, "create_connection", lambda *a, **k: ws)
+    monkeypatch.setattr(app.time, "sleep", sleeps.append)
+    with pytest.raises(StopLoop):
+        app._ws_loop("wss://example", "test", lambda w: None, lambda w, m: None)
+    assert ws.sent == ["ping", "ping"]
+    assert sleeps == []  # Không lần nào bị coi là mất kết nối